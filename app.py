@@ -4,10 +4,8 @@ No wizard. No settings sliders. Just pick files, enter names, and process.
 """
 
 import streamlit as st
-from utils.drive_queue import (
-    get_raw_files, get_heartbeat, submit_job,
-    get_status, build_job_payload
-)
+from utils.drive_queue import build_job_payload
+from utils.queue_backend import get_queue
 import time
 from datetime import datetime
 
@@ -142,12 +140,53 @@ KIT_COLOURS = {
     "Teal": "#14b8a6", "Navy": "#1e3a5f", "Yellow": "#eab308",
 }
 
+POLL_MIN_SECONDS = 3    # status poll interval right after a change
+POLL_MAX_SECONDS = 30   # ceiling while the status file stays the same
+
 def fmt_size(size_mb):
     return f"{size_mb / 1024:.1f} GB" if size_mb >= 1024 else f"{size_mb:.0f} MB"
 
+def fmt_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def render_metrics(metrics):
+    """Throughput, ETA, memory and per-stage timing from a status file's 'metrics'."""
+    eta = metrics.get("eta_seconds")
+    mem = metrics.get("memory_mb", {})
+    col_fps, col_eta, col_mem = st.columns(3)
+    col_fps.metric("Throughput", f"{metrics.get('fps', 0):.1f} fps")
+    col_eta.metric("Time left", fmt_duration(eta) if eta is not None else "—")
+    memory = fmt_size(mem["cpu"]) if mem.get("cpu") is not None else "—"
+    if mem.get("gpu") is not None:
+        memory += f" · GPU {fmt_size(mem['gpu'])}"
+    col_mem.metric("Memory", memory)
+
+    stages = metrics.get("stages", {})
+    if not stages:
+        return
+    with st.expander("Stage timing"):
+        # Busiest first — the top row is the bottleneck
+        rows = sorted(stages.items(), key=lambda kv: kv[1].get("busy") or 0, reverse=True)
+        lines = ["| Stage | fps while busy | Busy | Frames |", "|---|---:|---:|---:|"]
+        for name, s in rows:
+            fps  = f"{s['fps']:.1f}" if s.get("fps") is not None else "—"
+            busy = f"{s['busy']:.0%}" if s.get("busy") is not None else "—"
+            lines.append(f"| {name} | {fps} | {busy} | {s.get('frames', 0):,} |")
+        st.markdown("\n".join(lines))
+        queues = metrics.get("queues", {})
+        if queues:
+            st.caption("Queues: " + " · ".join(f"{name} {n}/{cap}" for name, (n, cap) in queues.items())
+                       + f" — last {metrics.get('window_seconds', 0):.0f}s")
+
 def init_session_state():
     defaults = {
-        "home_name": "", "away_name": "",
+        "home_name": "", "away_name": "", "venue": "",
+        "home_defends": "left", "second_half_mins": 0.0,
         "home_colour": "#ef4444", "away_colour": "#3b82f6",
         "squad_home": {}, "squad_away": {},
         "cam_a_filename": None, "cam_b_filename": None,
@@ -172,12 +211,22 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# ── Queue backend ─────────────────────────────────────────────────────────────
+# "drive" (default) talks to Google Drive; "local" uses a directory shared
+# with the processing engine and needs no Google sign-in.
+queue_kind = "drive"
+try:
+    queue_kind = st.secrets.get("queue_backend", "drive")
+except Exception:
+    pass
+queue = get_queue(queue_kind)
+
 # ══════════════════════════════════════════════════════════════════════════════
 # OAUTH LOGIN
 # ══════════════════════════════════════════════════════════════════════════════
 
 # Check if we have OAuth token in session state
-if "oauth_token" not in st.session_state:
+if queue_kind == "drive" and "oauth_token" not in st.session_state:
     # Check if we're returning from OAuth redirect with a code
     query_params = st.query_params
     if "code" in query_params:
@@ -219,14 +268,20 @@ if "oauth_token" not in st.session_state:
 
 folder_id = ""
 try:
-    folder_id = st.secrets.get("gdrive_folder_id", "")
+    folder_id = st.secrets.get(
+        "local_queue_dir" if queue_kind == "local" else "gdrive_folder_id", ""
+    )
 except Exception:
     pass
 
+if queue_kind == "local" and not folder_id:
+    st.error("queue_backend is 'local' but local_queue_dir is not set in Streamlit Secrets.")
+    st.stop()
+
 if not folder_id:
     folder_id = st.session_state.get("gdrive_folder_id", "")
 
-if not folder_id or len(folder_id) < 20:
+if queue_kind == "drive" and (not folder_id or len(folder_id) < 20):
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown("### 📁 Google Drive Setup")
     st.markdown(
@@ -245,7 +300,8 @@ if not folder_id or len(folder_id) < 20:
     st.markdown('</div>', unsafe_allow_html=True)
     st.stop()
 
-st.session_state["gdrive_folder_id"] = folder_id
+if queue_kind == "drive":
+    st.session_state["gdrive_folder_id"] = folder_id
 
 # ── Active job check ──────────────────────────────────────────────────────────
 active_job_id = st.session_state.get("active_job_id")
@@ -255,7 +311,11 @@ if active_job_id:
     st.markdown('<div class="card">', unsafe_allow_html=True)
     st.markdown("### ⚙️ Processing")
     
-    status = get_status(folder_id, active_job_id)
+    status, status_changed = queue.poll_status(folder_id, active_job_id)
+    # Poll quickly while the status is moving, back off while it isn't
+    poll_delay = st.session_state.get("_poll_delay", POLL_MIN_SECONDS)
+    poll_delay = POLL_MIN_SECONDS if status_changed else min(POLL_MAX_SECONDS, poll_delay * 1.5)
+    st.session_state["_poll_delay"] = poll_delay
     
     if status is None:
         st.markdown('<p class="status-warn">⏳ Waiting for Colab to pick up job…</p>',
@@ -285,9 +345,11 @@ if active_job_id:
             st.markdown(f'<p style="font-size:0.85rem;color:var(--muted)">{message}</p>',
                         unsafe_allow_html=True)
         st.progress(progress / 100)
+        if status.get("metrics"):
+            render_metrics(status["metrics"])
         
         st.markdown('</div>', unsafe_allow_html=True)
-        time.sleep(5)
+        time.sleep(poll_delay)
         st.rerun()
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -299,7 +361,12 @@ if active_job_id:
 
 # ── Colab status ──────────────────────────────────────────────────────────────
 st.session_state["_show_heartbeat_error"] = True  # Enable debug errors
-hb = get_heartbeat(folder_id)
+if st.session_state.get("_raw_files_cache") is None:
+    # First load (or Colab hasn't scanned yet) — fetch both in one round-trip
+    hb, raw_files = queue.get_heartbeat_and_raw_files(folder_id)
+    st.session_state["_raw_files_cache"] = raw_files
+else:
+    hb = queue.get_heartbeat(folder_id)
 colab_alive = hb is not None and hb.get("alive", False)
 
 col_status, col_btn = st.columns([3, 1])
@@ -339,7 +406,7 @@ with col_refresh:
     if st.button("🔄 Refresh", use_container_width=True):
         with st.spinner("Scanning Drive..."):
             time.sleep(1)  # Give Colab a moment if it's mid-write
-            files = get_raw_files(folder_id)
+            files = queue.get_raw_files(folder_id)
             st.session_state["_raw_files_cache"] = files
             if files is None:
                 st.warning("Colab hasn't scanned the folder yet. Make sure Colab is running, wait 30 seconds, then try again.")
@@ -355,7 +422,7 @@ with col_files_status:
         )
         # Debug: check if Colab has ever written the file
         if st.session_state.get("_show_debug"):
-            raw_result = get_raw_files(folder_id)
+            raw_result = queue.get_raw_files(folder_id)
             st.code(f"get_raw_files() returned: {raw_result}")
             st.info("If this shows 'None', Colab hasn't written filelist.json yet. "
                     "Check Colab is running and the watcher cell (Cell 5) is active.")
@@ -428,6 +495,23 @@ with col1:
     home_name = st.text_input("Home Team", placeholder="e.g. Rovers FC", key="home_name")
 with col2:
     away_name = st.text_input("Away Team", placeholder="e.g. United", key="away_name")
+st.text_input("Venue", placeholder="e.g. Rovers Park — optional, lets the engine reuse the pitch outline",
+              key="venue")
+col_end, col_half = st.columns(2)
+with col_end:
+    defends = st.selectbox("Home defends in the first half", ["Left goal", "Right goal"],
+                           key="home_defends_label")
+    st.session_state["home_defends"] = "left" if defends == "Left goal" else "right"
+with col_half:
+    st.number_input("Second half starts (minutes into the video)", min_value=0.0, step=0.5,
+                    key="second_half_mins",
+                    help="Teams swap ends here. Leave at 0 if unknown — the score overlay is then left off.")
+if queue_kind == "local":
+    # Shards are claimed by renames, which Google Drive doesn't make atomic
+    # between machines — so splitting is only offered on a local queue
+    st.number_input("Split across workers (minutes of video per part)", min_value=0, step=5,
+                    key="shard_minutes",
+                    help="0 processes the match on one worker. Needs every worker on the same queue folder.")
 
 st.markdown("**Kit Colours** — used for name tag overlays")
 col_hc, col_ac = st.columns(2)
@@ -532,6 +616,7 @@ else:
                         "match_date": datetime.now().strftime("%Y-%m-%d"),
                         "home_colour": st.session_state.get("home_colour", "#ef4444"),
                         "away_colour": st.session_state.get("away_colour", "#3b82f6"),
+                        "venue": st.session_state.get("venue", ""),
                     },
                     "stitch": {
                         "seam_auto": True,
@@ -541,6 +626,7 @@ else:
                         "stabilise": True,
                         "preview_stitch": False,
                         "camera_model": "Generic action camera (auto-calibrate)",
+                        "sync_window": 30,
                     },
                     "tracking": {
                         "shirt_min": 1,
@@ -549,6 +635,14 @@ else:
                         "kalman_window": 1.5,
                         "goal_conf": 75,
                         "halftime_mins": 10,
+                        "detect_batch": 8,
+                        "shard_minutes": st.session_state.get("shard_minutes", 0) if queue_kind == "local" else 0,
+                        "shard_warmup": 10,
+                        "detect_stride": 1,
+                        "detect_adaptive": False,
+                        "pitch_mask": True,
+                        "home_defends": st.session_state.get("home_defends", "left"),
+                        "second_half": st.session_state.get("second_half_mins", 0) * 60 or None,
                     },
                     "squad": {
                         "home": {str(k): v for k, v in st.session_state["squad_home"].items() if v},
@@ -559,6 +653,7 @@ else:
                         "resolution": "1920×1080 (1080p)",
                         "fps": "60 fps",
                         "export_fmt": "MP4 (H.264)",
+                        "keep_panorama": False,
                         "overlays": {
                             "score": True,
                             "timer": True,
@@ -576,8 +671,9 @@ else:
                     },
                 }
                 
-                job_id = submit_job(folder_id, job)
+                job_id = queue.submit_job(folder_id, job)
                 st.session_state["active_job_id"] = job_id
+                st.session_state.pop("_poll_delay", None)
                 st.rerun()
             except Exception as e:
                 st.error(f"Failed to submit job: {e}")
@@ -0,0 +1,32 @@
+"""
+Pieces of the notebook's pipeline cell, pulled out by name so the tests
+run without the Colab dependencies (YOLO, EasyOCR, a GPU).
+"""
+import ast
+import json
+import os
+
+import pytest
+
+NOTEBOOK = os.path.join(os.path.dirname(__file__), os.pardir, 'GameTracker_Colab.ipynb')
+
+
+@pytest.fixture(scope='session')
+def cell4():
+    """load(names, **globals): exec the named functions, classes and constants of Cell 4."""
+    with open(NOTEBOOK) as f:
+        cells = json.load(f)['cells']
+    source = next(''.join(c['source']) for c in cells
+                  if c['cell_type'] == 'code' and 'CELL 4' in ''.join(c['source']))
+    tree = ast.parse(source)
+
+    def load(names, **globals_):
+        body = [node for node in tree.body
+                if (isinstance(node, (ast.FunctionDef, ast.ClassDef)) and node.name in names)
+                or (isinstance(node, ast.Assign) and
+                    {getattr(t, 'id', None) for t in node.targets} & set(names))]
+        ns = dict(globals_)
+        exec(compile(ast.Module(body=body, type_ignores=[]), 'cell4', 'exec'), ns)
+        return ns
+
+    return load
@@ -0,0 +1,104 @@
+"""
+Checkpoints and panorama segments (notebook Cell 4). With the work folder
+on Google Drive the segments are encoded on the VM's disk and copied to
+Drive before each checkpoint — a new runtime resumes from those copies.
+"""
+import io
+import json
+import os
+import pickle
+import queue
+import re
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+NEEDED  = {'DRIVE_ROOT', 'LOCAL_WORK', 'CHECKPOINT_FILE', 'on_google_drive', '_atomic_write',
+           'load_checkpoint', 'save_checkpoint', 'segment_path', 'segment_dir', 'find_segments',
+           'SegmentWriter', 'TAG_DTYPE', 'PlayerTags', 'load_tags'}
+SEGMENT = 10   # frames per segment
+
+
+class FakeEncoder:
+    """Writes the frame numbers it was given, on release."""
+
+    def __init__(self, path):
+        self.path, self.frames = path, []
+
+    def write(self, frame):
+        self.frames.append(frame)
+
+    def release(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.frames, f)
+
+    def abort(self):
+        pass
+
+
+@pytest.fixture
+def ns(cell4, tmp_path):
+    ns = cell4(NEEDED, os=os, re=re, io=io, json=json, pickle=pickle, shutil=shutil,
+               queue=queue, threading=threading, datetime=datetime, np=np,
+               tempfile=tempfile)
+    ns['DRIVE_ROOT'] = str(tmp_path / 'drive')
+    ns['LOCAL_WORK'] = str(tmp_path / 'vm')
+    return ns
+
+
+def run(ns, work_dir, n_frames):
+    """Encode n_frames with a cut (and tags flush) every SEGMENT frames, like process_job."""
+    seg_dir    = ns['segment_dir'](work_dir)
+    checkpoint = {'next_frame': 0, 'segments': 0}
+    tags       = ns['PlayerTags'](0)
+    make       = lambda i: FakeEncoder(ns['segment_path'](seg_dir, 'pano', i))
+    with ns['SegmentWriter'](work_dir, checkpoint, make, seg_dir) as segments:
+        for frame in range(n_frames):
+            segments.write(frame)
+            tags.add(frame, (0, 0, 10, 20), 7, True)
+            if (frame + 1) % SEGMENT == 0:
+                tag_file = tags.flush(seg_dir, frame + 1)
+                segments.cut(frame + 1, pickle.dumps({'frame': frame}), [tag_file])
+    return seg_dir
+
+
+def test_resume_when_the_local_segments_are_gone(ns, tmp_path):
+    work_dir = str(tmp_path / 'drive' / 'output' / 'job_work')
+    os.makedirs(work_dir)
+    seg_dir = run(ns, work_dir, 2 * SEGMENT + 5)
+    assert seg_dir != work_dir
+    shutil.rmtree(seg_dir)   # the runtime went down with its disk
+
+    info, state = ns['load_checkpoint'](work_dir)
+    assert (info['next_frame'], info['segments']) == (2 * SEGMENT, 2)
+    assert state == {'frame': 2 * SEGMENT - 1}
+
+    seg_dir = ns['segment_dir'](work_dir)   # the new runtime's, empty
+    paths = ns['find_segments'](work_dir, seg_dir, info['segments'])
+    assert paths == [ns['segment_path'](work_dir, 'pano', i) for i in range(2)]
+    with open(paths[1]) as f:
+        assert json.load(f) == list(range(SEGMENT, 2 * SEGMENT))
+    tags = ns['load_tags']([seg_dir, work_dir])
+    assert tags['frame'].tolist() == list(range(2 * SEGMENT))
+
+
+def test_missing_segment_means_no_resume(ns, tmp_path):
+    work_dir = str(tmp_path / 'drive' / 'output' / 'job_work')
+    os.makedirs(work_dir)
+    run(ns, work_dir, 2 * SEGMENT)
+    os.remove(ns['segment_path'](work_dir, 'pano', 0))
+    shutil.rmtree(ns['segment_dir'](work_dir))
+    assert ns['find_segments'](work_dir, ns['segment_dir'](work_dir), 2) is None
+
+
+def test_local_work_folder_needs_no_copy(ns, tmp_path):
+    work_dir = str(tmp_path / 'output' / 'job_work')
+    os.makedirs(work_dir)
+    assert run(ns, work_dir, SEGMENT) == work_dir
+    info, _ = ns['load_checkpoint'](work_dir)
+    assert info['segments'] == 1
+    assert ns['find_segments'](work_dir, work_dir, 1) == [ns['segment_path'](work_dir, 'pano', 0)]
@@ -0,0 +1,75 @@
+"""
+Goal detection (notebook Cell 4, Stage 5). Only detect_goals and what it
+uses are pulled out of the notebook.
+"""
+import json
+import os
+import re
+
+import numpy as np
+import pytest
+
+NEEDED   = {'BALL_DTYPE', 'GOAL_MOUTHS', 'GOAL_WINDOW', 'GOAL_DWELL', 'GOAL_COOLDOWN',
+            'points_in_polygon', 'detect_goals',
+            'venue_slug', 'venue_goals_path', 'load_goal_mouths'}
+FPS      = 10
+CANVAS   = (1000, 500)
+IN_NET   = (10.0, 250.0)     # inside the default left mouth
+OUTFIELD = (500.0, 250.0)
+
+
+@pytest.fixture(scope='module')
+def goals(cell4):
+    return cell4(NEEDED, np=np, os=os, re=re, json=json)
+
+
+def track(ns, positions):
+    """BallTrack-style array from a list of (x, y) or None per frame, all detected."""
+    data = np.zeros(len(positions), dtype=ns['BALL_DTYPE'])
+    data['frame'] = np.arange(len(positions))
+    for i, p in enumerate(positions):
+        data['x'][i], data['y'][i] = p if p else (np.nan, np.nan)
+        data['detected'][i] = p is not None
+    return data
+
+
+def test_ball_still_in_the_net_at_the_end(goals):
+    frames = track(goals, [OUTFIELD] * 50 + [IN_NET] * 20)
+    events = goals['detect_goals'](frames, FPS, CANVAS, goal_conf=50)
+    assert [(e['goal'], e['frame']) for e in events] == [('left', 50)]
+
+
+def test_gap_in_the_net_is_not_a_second_goal(goals):
+    # In the net, lost for longer than the cooldown, seen in the net again
+    gap = int(goals['GOAL_COOLDOWN'] * FPS) + 50
+    frames = track(goals, [OUTFIELD] * 50 + [IN_NET] * 20 + [None] * gap + [IN_NET] * 20)
+    events = goals['detect_goals'](frames, FPS, CANVAS, goal_conf=50)
+    assert [e['frame'] for e in events] == [50]
+
+
+def test_goal_after_leaving_the_net_counts_again(goals):
+    later = 70 + int(goals['GOAL_COOLDOWN'] * FPS) + 50
+    frames = track(goals, [OUTFIELD] * 50 + [IN_NET] * 20 + [OUTFIELD] * (later - 70) + [IN_NET] * 20)
+    events = goals['detect_goals'](frames, FPS, CANVAS, goal_conf=50)
+    assert [e['frame'] for e in events] == [50, later]
+
+
+def test_venue_goal_mouths_replace_the_defaults(goals, tmp_path):
+    # This venue's left mouth is mid-canvas, around OUTFIELD — not at the edge
+    mouths = {'left':  [[0.45, 0.4], [0.55, 0.4], [0.55, 0.6], [0.45, 0.6]],
+              'right': [[0.96, 0.3], [1.0, 0.3], [1.0, 0.7], [0.96, 0.7]]}
+    with open(goals['venue_goals_path'](str(tmp_path), 'Rovers Park'), 'w') as f:
+        json.dump(mouths, f)
+    loaded = goals['load_goal_mouths'](str(tmp_path), 'Rovers Park')
+    frames = track(goals, [IN_NET] * 50 + [OUTFIELD] * 20)
+    events = goals['detect_goals'](frames, FPS, CANVAS, goal_conf=50, goal_mouths=loaded)
+    assert [(e['goal'], e['frame']) for e in events] == [('left', 50)]
+    assert goals['detect_goals'](frames, FPS, CANVAS, goal_conf=50) == []
+
+
+def test_venue_without_goal_mouths_falls_back(goals, tmp_path):
+    assert goals['load_goal_mouths'](str(tmp_path), 'Elsewhere') is None
+    assert goals['load_goal_mouths'](str(tmp_path), '') is None
+    with open(goals['venue_goals_path'](str(tmp_path), 'Broken'), 'w') as f:
+        json.dump({'left': [[0, 0]]}, f)
+    assert goals['load_goal_mouths'](str(tmp_path), 'Broken') is None
@@ -9,18 +9,25 @@ from __future__ import annotations
 
 import json
 import time
-import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional
 
 import streamlit as st
 
+from utils.queue_backend import (
+    FILELIST_FILE, HEARTBEAT_FILE, JOB_PREFIX, JOBS_FOLDER_NAME, STATUS_PREFIX,
+    heartbeat_from, job_record, new_job_id, raw_files_from,
+)
+
 # ── Optional import — only needed at runtime ────────────────────────────────
 try:
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import Flow
     from googleapiclient.discovery import build
     from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+    from google_auth_httplib2 import AuthorizedHttp, Request as AuthRequest
+    import httplib2
     import io
     GDRIVE_AVAILABLE = True
 except ImportError:
@@ -28,9 +35,9 @@ except ImportError:
 
 
 SCOPES = ["https://www.googleapis.com/auth/drive"]
-JOBS_FOLDER_NAME = "jobs"
-STATUS_PREFIX    = "status_"
-JOB_PREFIX       = "job_"
+ID_CACHE_TTL     = 300  # seconds a resolved Drive file/folder ID is trusted
+HTTP_TIMEOUT     = 30   # seconds per Drive request
+MAX_PARALLEL_DOWNLOADS = 4
 
 
 # ── OAuth authentication ────────────────────────────────────────────────────
@@ -69,11 +76,33 @@ def exchange_code_for_token(code: str) -> dict:
         "client_id": flow.credentials.client_id,
         "client_secret": flow.credentials.client_secret,
         "scopes": flow.credentials.scopes,
+        "expiry": (
+            flow.credentials.expiry.isoformat() if flow.credentials.expiry else None
+        ),
     }
 
 
+def _session_key(token_info: dict) -> tuple:
+    """Identify a login: the refresh token survives access-token refreshes."""
+    return (token_info["client_id"], token_info.get("refresh_token") or token_info["token"])
+
+
+def _store_refreshed_token(creds, token_info: dict) -> None:
+    """Write a refreshed access token back to st.session_state['oauth_token']."""
+    if creds.token and creds.token != token_info.get("token"):
+        token_info["token"] = creds.token
+        token_info["expiry"] = creds.expiry.isoformat() if creds.expiry else None
+
+
 def _get_drive_service():
-    """Build Drive service using stored OAuth credentials from session state."""
+    """
+    Return the Drive service for this session, building it on first use.
+
+    The service, its credentials and its keep-alive HTTP connection are kept
+    in session state and reused across calls and reruns until the user signs
+    in with a different account. Tokens refreshed along the way are written
+    back to oauth_token.
+    """
     if not GDRIVE_AVAILABLE:
         raise RuntimeError("google-api-python-client not installed")
     
@@ -81,19 +110,76 @@ def _get_drive_service():
     if not token_info:
         raise RuntimeError("Not authenticated — user needs to sign in with Google")
     
-    creds = Credentials(
-        token=token_info["token"],
-        refresh_token=token_info.get("refresh_token"),
-        token_uri=token_info["token_uri"],
-        client_id=token_info["client_id"],
-        client_secret=token_info["client_secret"],
-        scopes=token_info["scopes"],
-    )
-    return build("drive", "v3", credentials=creds, cache_discovery=False)
+    key    = _session_key(token_info)
+    cached = st.session_state.get("_drive_service")
+    if cached and cached["key"] == key:
+        creds, service = cached["creds"], cached["service"]
+    else:
+        expiry = token_info.get("expiry")
+        creds = Credentials(
+            token=token_info["token"],
+            refresh_token=token_info.get("refresh_token"),
+            token_uri=token_info["token_uri"],
+            client_id=token_info["client_id"],
+            client_secret=token_info["client_secret"],
+            scopes=token_info["scopes"],
+            expiry=datetime.fromisoformat(expiry) if expiry else None,
+        )
+        # httplib2 keeps the TLS connection to googleapis.com open between
+        # requests; AuthorizedHttp refreshes the token on 401.
+        http    = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        service = build("drive", "v3", http=http, cache_discovery=False)
+        st.session_state["_drive_service"] = {
+            "key": key, "creds": creds, "service": service,
+        }
+
+    if creds.expired and creds.refresh_token:
+        creds.refresh(AuthRequest(httplib2.Http(timeout=HTTP_TIMEOUT)))
+    _store_refreshed_token(creds, token_info)
+    return service
+
+
+# ── Name → ID cache ─────────────────────────────────────────────────────────
+# Drive has no path lookup, so every read used to start with a files().list
+# query. Resolved IDs are kept in session state for ID_CACHE_TTL seconds and
+# dropped as soon as Drive answers 404 for them (file replaced or deleted).
+
+def _id_cache() -> dict:
+    return st.session_state.setdefault("_drive_id_cache", {})
+
+
+def _cached_id(parent_id: str, name: str) -> Optional[str]:
+    entry = _id_cache().get((parent_id, name))
+    if entry is None:
+        return None
+    file_id, expires = entry
+    if time.time() >= expires:
+        _forget_id(parent_id, name)
+        return None
+    return file_id
+
+
+def _remember_id(parent_id: str, name: str, file_id: str) -> None:
+    _id_cache()[(parent_id, name)] = (file_id, time.time() + ID_CACHE_TTL)
+
+
+def _forget_id(parent_id: str, name: str) -> None:
+    _id_cache().pop((parent_id, name), None)
 
 
+def _is_not_found(exc: Exception) -> bool:
+    """True if exc is a Drive HttpError with status 404."""
+    resp = getattr(exc, "resp", None)
+    return getattr(resp, "status", None) == 404
+
+
+# ── Drive helpers ───────────────────────────────────────────────────────────
+
 def _get_or_create_folder(service, name: str, parent_id: str) -> str:
     """Return the ID of a folder inside parent, creating it if needed."""
+    cached = _cached_id(parent_id, name)
+    if cached:
+        return cached
     q = (
         f"name='{name}' and mimeType='application/vnd.google-apps.folder' "
         f"and '{parent_id}' in parents and trashed=false"
@@ -103,6 +189,7 @@ def _get_or_create_folder(service, name: str, parent_id: str) -> str:
     ).execute()
     files = results.get("files", [])
     if files:
+        _remember_id(parent_id, name, files[0]["id"])
         return files[0]["id"]
     meta = {
         "name": name,
@@ -112,74 +199,96 @@ def _get_or_create_folder(service, name: str, parent_id: str) -> str:
     folder = service.files().create(
         body=meta, fields="id", supportsAllDrives=True
     ).execute()
+    _remember_id(parent_id, name, folder["id"])
     return folder["id"]
 
 
+def _find_file_id(service, folder_id: str, filename: str) -> Optional[str]:
+    """Return the ID of a file in a Drive folder (cached), or None."""
+    cached = _cached_id(folder_id, filename)
+    if cached:
+        return cached
+    q = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
+    files = service.files().list(
+        q=q, fields="files(id)", supportsAllDrives=True, includeItemsFromAllDrives=True
+    ).execute().get("files", [])
+    if not files:
+        return None
+    _remember_id(folder_id, filename, files[0]["id"])
+    return files[0]["id"]
+
+
+def _download_json(service, file_id: str) -> dict:
+    """Download a Drive file by ID and parse it as JSON."""
+    buf = io.BytesIO()
+    downloader = MediaIoBaseDownload(
+        buf, service.files().get_media(fileId=file_id, supportsAllDrives=True)
+    )
+    done = False
+    while not done:
+        _, done = downloader.next_chunk()
+    buf.seek(0)
+    return json.loads(buf.read().decode("utf-8"))
+
+
 def _write_json(service, folder_id: str, filename: str, data: dict) -> str:
     """Upload (or overwrite) a JSON file in a Drive folder. Returns file ID."""
     content = json.dumps(data, indent=2).encode("utf-8")
-    media = MediaIoBaseUpload(
-        io.BytesIO(content), mimetype="application/json", resumable=False
-    )
+
+    def media():
+        return MediaIoBaseUpload(
+            io.BytesIO(content), mimetype="application/json", resumable=False
+        )
+
     # Check if file already exists (overwrite)
-    q = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-    existing = service.files().list(
-        q=q, fields="files(id)", supportsAllDrives=True, includeItemsFromAllDrives=True
-    ).execute().get("files", [])
-    if existing:
-        service.files().update(
-            fileId=existing[0]["id"], media_body=media, supportsAllDrives=True
-        ).execute()
-        return existing[0]["id"]
-    else:
-        meta = {"name": filename, "parents": [folder_id]}
-        f = service.files().create(
-            body=meta, media_body=media, fields="id", supportsAllDrives=True
-        ).execute()
-        return f["id"]
+    file_id = _find_file_id(service, folder_id, filename)
+    if file_id:
+        try:
+            service.files().update(
+                fileId=file_id, media_body=media(), supportsAllDrives=True
+            ).execute()
+            return file_id
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            _forget_id(folder_id, filename)
+
+    meta = {"name": filename, "parents": [folder_id]}
+    f = service.files().create(
+        body=meta, media_body=media(), fields="id", supportsAllDrives=True
+    ).execute()
+    _remember_id(folder_id, filename, f["id"])
+    return f["id"]
 
 
 def _read_json(service, folder_id: str, filename: str) -> Optional[dict]:
     """Read a JSON file from a Drive folder. Returns None if not found."""
-    import streamlit as st
     debug = st.session_state.get("_show_heartbeat_error", False)
     
     try:
         if debug:
             st.info(f"🔍 Looking for {filename} in folder {folder_id}")
         
-        q = f"name='{filename}' and '{folder_id}' in parents and trashed=false"
-        if debug:
-            st.info(f"🔍 Query: {q}")
-        
-        results = service.files().list(
-            q=q, 
-            fields="files(id, name)", 
-            supportsAllDrives=True, 
-            includeItemsFromAllDrives=True
-        ).execute()
-        
-        files = results.get("files", [])
-        if debug:
-            st.info(f"🔍 Found {len(files)} file(s): {[f.get('name') for f in files]}")
-        
-        if not files:
+        file_id = _find_file_id(service, folder_id, filename)
+        if not file_id:
             if debug:
                 st.warning(f"⚠️ File '{filename}' not found in folder {folder_id}")
             return None
         
         if debug:
-            st.info(f"🔍 Downloading file ID: {files[0]['id']}")
+            st.info(f"🔍 Downloading file ID: {file_id}")
         
-        buf = io.BytesIO()
-        downloader = MediaIoBaseDownload(
-            buf, service.files().get_media(fileId=files[0]["id"], supportsAllDrives=True)
-        )
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-        buf.seek(0)
-        data = json.loads(buf.read().decode("utf-8"))
+        try:
+            data = _download_json(service, file_id)
+        except Exception as e:
+            if not _is_not_found(e):
+                raise
+            # Stale cached ID — the file was replaced or deleted; look it up again
+            _forget_id(folder_id, filename)
+            file_id = _find_file_id(service, folder_id, filename)
+            if not file_id:
+                return None
+            data = _download_json(service, file_id)
         
         if debug:
             st.success(f"✓ Successfully read {filename}")
@@ -191,6 +300,125 @@ def _read_json(service, folder_id: str, filename: str) -> Optional[dict]:
         return None
 
 
+def _read_json_if_changed(service, folder_id: str, filename: str) -> tuple:
+    """
+    Conditional read of a JSON file that is polled repeatedly.
+
+    A metadata-only files().get compares md5Checksum/modifiedTime with the
+    last copy this session downloaded; the body is only fetched when the
+    version differs. Returns (data, changed) — data is None if the file does
+    not exist, and the last good copy is returned unchanged if Drive errors.
+    """
+    contents = st.session_state.setdefault("_drive_content_cache", {})
+    key      = (folder_id, filename)
+    previous = contents.get(key)
+    try:
+        meta = None
+        for _ in range(2):
+            file_id = _find_file_id(service, folder_id, filename)
+            if not file_id:
+                break
+            try:
+                meta = service.files().get(
+                    fileId=file_id, fields="md5Checksum, modifiedTime, trashed",
+                    supportsAllDrives=True,
+                ).execute()
+            except Exception as e:
+                if not _is_not_found(e):
+                    raise
+            if meta is not None and not meta.get("trashed"):
+                break
+            # Cached ID is stale (file replaced by rename, or deleted) — look up again
+            meta = None
+            _forget_id(folder_id, filename)
+        if meta is None:
+            contents.pop(key, None)
+            return None, previous is not None
+
+        version = meta.get("md5Checksum") or meta.get("modifiedTime")
+        if previous and previous[0] == version:
+            return previous[1], False
+        data = _download_json(service, file_id)
+        contents[key] = (version, data)
+        return data, True
+    except Exception as e:
+        if st.session_state.get("_show_heartbeat_error", False):
+            st.error(f"❌ Error reading {filename}: {type(e).__name__}: {e}")
+        return (previous[1] if previous else None), False
+
+
+def _http_pool(size: int) -> list:
+    """
+    Return `size` keep-alive HTTP transports for parallel downloads.
+
+    httplib2 connections are not thread-safe, so each download worker gets
+    its own. They are kept with the session's service so the TLS connections
+    survive reruns.
+    """
+    cached = st.session_state["_drive_service"]
+    pool   = cached.setdefault("http_pool", [])
+    while len(pool) < size:
+        pool.append(AuthorizedHttp(
+            cached["creds"], http=httplib2.Http(timeout=HTTP_TIMEOUT)
+        ))
+    return pool[:size]
+
+
+def _resolve_ids(service, folder_id: str, filenames: list) -> dict:
+    """Resolve several filenames in a folder with at most one files().list call."""
+    ids     = {}
+    missing = []
+    for name in filenames:
+        cached = _cached_id(folder_id, name)
+        if cached:
+            ids[name] = cached
+        else:
+            missing.append(name)
+    if not missing:
+        return ids
+
+    names_q = " or ".join(f"name='{name}'" for name in missing)
+    q = f"({names_q}) and '{folder_id}' in parents and trashed=false"
+    files = service.files().list(
+        q=q, fields="files(id, name)", pageSize=100,
+        supportsAllDrives=True, includeItemsFromAllDrives=True,
+    ).execute().get("files", [])
+    for f in files:
+        if f["name"] in missing and f["name"] not in ids:
+            ids[f["name"]] = f["id"]
+            _remember_id(folder_id, f["name"], f["id"])
+    return ids
+
+
+def _download_many(service, file_ids: dict) -> dict:
+    """
+    Download several JSON files concurrently.
+    Returns {name: parsed dict or the exception raised for that file}.
+    """
+    names   = list(file_ids)
+    workers = min(MAX_PARALLEL_DOWNLOADS, len(names))
+    pool    = _http_pool(workers)
+
+    def fetch_chunk(worker: int) -> dict:
+        http = pool[worker]
+        out  = {}
+        for name in names[worker::workers]:
+            try:
+                raw = service.files().get_media(
+                    fileId=file_ids[name], supportsAllDrives=True
+                ).execute(http=http)
+                out[name] = json.loads(raw.decode("utf-8"))
+            except Exception as e:
+                out[name] = e
+        return out
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(fetch_chunk, range(workers)):
+            results.update(chunk)
+    return results
+
+
 # ── Public API ──────────────────────────────────────────────────────────────
 
 def submit_job(root_folder_id: str, job_payload: dict) -> str:
@@ -202,16 +430,9 @@ def submit_job(root_folder_id: str, job_payload: dict) -> str:
     service   = _get_drive_service()
     jobs_folder = _get_or_create_folder(service, JOBS_FOLDER_NAME, root_folder_id)
 
-    job_id   = datetime.now().strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:6]
+    job_id   = new_job_id()
     filename = f"{JOB_PREFIX}{job_id}.json"
-
-    payload = {
-        "job_id":    job_id,
-        "submitted": datetime.utcnow().isoformat(),
-        "status":    "queued",
-        **job_payload,
-    }
-    _write_json(service, jobs_folder, filename, payload)
+    _write_json(service, jobs_folder, filename, job_record(job_id, job_payload))
     return job_id
 
 
@@ -233,10 +454,50 @@ def get_status(root_folder_id: str, job_id: str) -> Optional[dict]:
       "error":    "..."            # set on error
     }
     """
+    return poll_status(root_folder_id, job_id)[0]
+
+
+def poll_status(root_folder_id: str, job_id: str) -> tuple:
+    """
+    Like get_status(), but for polling loops: returns (status, changed).
+
+    With warm caches an unchanged status costs one metadata request and no
+    download; `changed` is True only when Colab has rewritten the file since
+    the previous poll in this session.
+    """
     service     = _get_drive_service()
     jobs_folder = _get_or_create_folder(service, JOBS_FOLDER_NAME, root_folder_id)
     filename    = f"{STATUS_PREFIX}{job_id}.json"
-    return _read_json(service, jobs_folder, filename)
+    return _read_json_if_changed(service, jobs_folder, filename)
+
+
+def read_many(root_folder_id: str, names: list) -> dict:
+    """
+    Read several JSON files from the jobs folder in one go.
+
+    All names are resolved with a single files().list query (cached IDs skip
+    it entirely) and the files are downloaded in parallel. Returns
+    {name: dict or None}; None means missing or unreadable.
+    """
+    service     = _get_drive_service()
+    jobs_folder = _get_or_create_folder(service, JOBS_FOLDER_NAME, root_folder_id)
+    file_ids    = _resolve_ids(service, jobs_folder, names)
+    results     = {name: None for name in names}
+    if not file_ids:
+        return results
+
+    debug = st.session_state.get("_show_heartbeat_error", False)
+    for name, data in _download_many(service, file_ids).items():
+        if isinstance(data, Exception):
+            if _is_not_found(data):
+                # Stale cached ID — fall back to a fresh single-file read
+                _forget_id(jobs_folder, name)
+                results[name] = _read_json(service, jobs_folder, name)
+            elif debug:
+                st.error(f"❌ Error reading {name}: {type(data).__name__}: {data}")
+            continue
+        results[name] = data
+    return results
 
 
 def get_raw_files(root_folder_id: str) -> Optional[list]:
@@ -248,8 +509,7 @@ def get_raw_files(root_folder_id: str) -> Optional[list]:
     try:
         service     = _get_drive_service()
         jobs_folder = _get_or_create_folder(service, JOBS_FOLDER_NAME, root_folder_id)
-        data        = _read_json(service, jobs_folder, "filelist.json")
-        return data.get("files", []) if data else None
+        return raw_files_from(_read_json(service, jobs_folder, FILELIST_FILE))
     except Exception:
         return None
 
@@ -270,31 +530,36 @@ def get_heartbeat(root_folder_id: str) -> Optional[dict]:
     try:
         service = _get_drive_service()
         jobs_folder = _get_or_create_folder(service, JOBS_FOLDER_NAME, root_folder_id)
-        data = _read_json(service, jobs_folder, "heartbeat.json")
-        if data is None:
-            return None
-        # Check staleness — if last update was > 90 seconds ago, Colab has died
-        from datetime import timezone
-        updated_str = data.get("updated", "")
-        if updated_str:
-            updated = datetime.fromisoformat(updated_str)
-            age = (datetime.utcnow() - updated).total_seconds()
-            if age > 90:
-                return {"alive": False, "age_seconds": int(age)}
-        return data
+        return heartbeat_from(_read_json(service, jobs_folder, HEARTBEAT_FILE))
     except Exception as e:
         # Debug: log the error so we can see what's failing
-        import streamlit as st
         if st.session_state.get("_show_heartbeat_error"):
             st.error(f"Heartbeat error: {type(e).__name__}: {e}")
         return None
 
 
-def build_job_payload(ss) -> dict:
+def get_heartbeat_and_raw_files(root_folder_id: str) -> tuple:
+    """
+    get_heartbeat() and get_raw_files() in a single batched read.
+    Returns (heartbeat, raw_files) with the same None semantics as those two.
+    """
+    try:
+        data = read_many(root_folder_id, [HEARTBEAT_FILE, FILELIST_FILE])
+    except Exception as e:
+        if st.session_state.get("_show_heartbeat_error"):
+            st.error(f"Heartbeat error: {type(e).__name__}: {e}")
+        return None, None
+    return heartbeat_from(data[HEARTBEAT_FILE]), raw_files_from(data[FILELIST_FILE])
+
+
+def build_job_payload(ss, queue_kind: str = "drive") -> dict:
     """
     Build the full job payload dict from Streamlit session_state (ss).
     This is everything Colab needs to run the processing pipeline.
+    Sharding is only sent for a "local" queue — Drive can't hand shards
+    out to several workers safely.
     """
+    shard_minutes = ss.get("shard_minutes", 0) if queue_kind == "local" else 0
     return {
         # Match info
         "match": {
@@ -303,6 +568,7 @@ def build_job_payload(ss) -> dict:
             "match_date":   str(ss.get("match_date", "")),
             "home_colour":  ss.get("home_colour", "#ef4444"),
             "away_colour":  ss.get("away_colour", "#3b82f6"),
+            "venue":        ss.get("venue", ""),         # pitch mask is cached per venue
         },
         # Stitch settings
         "stitch": {
@@ -313,6 +579,7 @@ def build_job_payload(ss) -> dict:
             "stabilise":      ss.get("stabilise", True),
             "preview_stitch": ss.get("preview_stitch", True),
             "camera_model":   ss.get("camera_model", "Generic action camera (auto-calibrate)"),
+            "sync_window":    ss.get("sync_window", 30),       # seconds of audio for clap sync
         },
         # Tracking settings
         "tracking": {
@@ -322,6 +589,14 @@ def build_job_payload(ss) -> dict:
             "kalman_window":  ss.get("kalman_window", 1.5),
             "goal_conf":      ss.get("goal_conf", 75),
             "halftime_mins":  ss.get("halftime_mins", 10),
+            "detect_batch":   ss.get("detect_batch", 8),    # frames per YOLO call
+            "shard_minutes":  shard_minutes,                # 0 = one worker per match
+            "shard_warmup":   ss.get("shard_warmup", 10),   # seconds replayed before each shard
+            "detect_stride":  ss.get("detect_stride", 1),   # YOLO on every Nth frame, tracked between
+            "detect_adaptive": ss.get("detect_adaptive", False),  # detect sooner on motion / lost tracks
+            "pitch_mask":     ss.get("pitch_mask", True),   # detect only on and around the pitch
+            "home_defends":   ss.get("home_defends", "left"),  # goal mouth home defends in the first half
+            "second_half":    ss.get("second_half_mins", 0) * 60 or None,  # video seconds; None = unknown
         },
         # Squad names  { "20": "JAMES", "21": "OLIVER", ... }
         "squad": {
@@ -340,6 +615,7 @@ def build_job_payload(ss) -> dict:
             "resolution":     ss.get("resolution", "1920×1080 (1080p)"),
             "fps":            ss.get("fps", "60 fps"),
             "export_fmt":     ss.get("export_fmt", "MP4 (H.264)"),
+            "keep_panorama":  ss.get("keep_panorama", False),  # also save the full stitched panorama
             "overlays": {
                 "score":      ss.get("ov_score", True),
                 "timer":      ss.get("ov_timer", True),
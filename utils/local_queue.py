@@ -0,0 +1,147 @@
+"""
+local_queue.py — filesystem job queue for GameTracker
+
+Same API as drive_queue (see queue_backend.py), but `root` is a directory:
+the GameTracker folder with jobs/ and raw/ inside, on local disk or a NAS
+share that the processing engine also mounts. No Google dependencies and
+Streamlit is optional, so the whole job flow can be driven from a script.
+
+Writes go to a hidden temp file in the same directory and are renamed into
+place, so a reader never sees a half-written job or status file.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from typing import Optional
+
+from utils.queue_backend import (
+    FILELIST_FILE, HEARTBEAT_FILE, JOB_PREFIX, JOBS_FOLDER_NAME,
+    RAW_FOLDER_NAME, STATUS_PREFIX,
+    heartbeat_from, job_record, new_job_id, raw_files_from,
+)
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi")
+
+# path → ((mtime_ns, size), data) for poll_status outside Streamlit
+_script_cache: dict = {}
+
+
+# ── File helpers ────────────────────────────────────────────────────────────
+
+def _content_cache() -> dict:
+    """
+    poll_status's last-read copies. Kept per Streamlit session, like
+    drive_queue's, so one session's unchanged poll never answers for
+    another; a module dict when there is no Streamlit session (scripts).
+    """
+    try:
+        import streamlit as st
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return _script_cache
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return _script_cache
+    return st.session_state.setdefault("_local_content_cache", {})
+
+
+def _jobs_dir(root: str) -> str:
+    path = os.path.join(root, JOBS_FOLDER_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_json(folder: str, filename: str, data: dict) -> str:
+    """Atomically write a JSON file into folder. Returns its path."""
+    path = os.path.join(folder, filename)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def _read_json(folder: str, filename: str) -> Optional[dict]:
+    """Read a JSON file from folder. Returns None if missing or unreadable."""
+    try:
+        with open(os.path.join(folder, filename)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# ── Public API ──────────────────────────────────────────────────────────────
+
+def submit_job(root: str, job_payload: dict) -> str:
+    """Write jobs/job_<id>.json under root. Returns the job_id."""
+    job_id = new_job_id()
+    _write_json(_jobs_dir(root), f"{JOB_PREFIX}{job_id}.json",
+                job_record(job_id, job_payload))
+    return job_id
+
+
+def get_status(root: str, job_id: str) -> Optional[dict]:
+    """Read jobs/status_<job_id>.json. Same shape as drive_queue.get_status."""
+    return _read_json(_jobs_dir(root), f"{STATUS_PREFIX}{job_id}.json")
+
+
+def poll_status(root: str, job_id: str) -> tuple:
+    """
+    Returns (status, changed). The file is only re-read when its mtime or
+    size differs from the previous poll in this session.
+    """
+    contents = _content_cache()
+    path     = os.path.join(_jobs_dir(root), f"{STATUS_PREFIX}{job_id}.json")
+    previous = contents.get(path)
+    try:
+        info = os.stat(path)
+    except FileNotFoundError:
+        contents.pop(path, None)
+        return None, previous is not None
+
+    version = (info.st_mtime_ns, info.st_size)
+    if previous and previous[0] == version:
+        return previous[1], False
+    data = get_status(root, job_id)
+    if data is None:
+        # Mid-write by a non-atomic writer — keep the last good copy
+        return (previous[1] if previous else None), False
+    contents[path] = (version, data)
+    return data, True
+
+
+def get_raw_files(root: str) -> Optional[list]:
+    """
+    List the videos in root/raw/ directly — no need to wait for the engine
+    to write filelist.json. Falls back to filelist.json if raw/ is absent.
+    """
+    raw_dir = os.path.join(root, RAW_FOLDER_NAME)
+    try:
+        entries = list(os.scandir(raw_dir))
+    except FileNotFoundError:
+        return raw_files_from(_read_json(_jobs_dir(root), FILELIST_FILE))
+    return [
+        {"name": e.name, "size_mb": round(e.stat().st_size / (1024 * 1024))}
+        for e in sorted(entries, key=lambda e: e.name)
+        if e.is_file() and e.name.lower().endswith(VIDEO_EXTENSIONS)
+    ]
+
+
+def get_heartbeat(root: str) -> Optional[dict]:
+    """Read jobs/heartbeat.json with the same staleness rule as Drive."""
+    return heartbeat_from(_read_json(_jobs_dir(root), HEARTBEAT_FILE))
+
+
+def get_heartbeat_and_raw_files(root: str) -> tuple:
+    return get_heartbeat(root), get_raw_files(root)
@@ -0,0 +1,85 @@
+"""
+queue_backend.py — pick where the GameTracker job queue lives
+
+Two interchangeable backends expose the same module-level API:
+
+  utils.drive_queue  — Google Drive via the Drive API (Streamlit Cloud + Colab)
+  utils.local_queue  — a plain directory on local disk or a NAS share
+                       (app and engine on one box, offline load tests)
+
+Every backend module provides:
+
+  submit_job(root, job_payload)        -> job_id
+  get_status(root, job_id)             -> status dict | None
+  poll_status(root, job_id)            -> (status dict | None, changed)
+  get_heartbeat(root)                  -> heartbeat dict | None
+  get_raw_files(root)                  -> [{'name', 'size_mb'}, ...] | None
+  get_heartbeat_and_raw_files(root)    -> (heartbeat, raw_files)
+
+`root` is the GameTracker folder: a Drive folder ID for "drive", a
+directory path for "local". Both lay it out the same way (jobs/, raw/),
+which is what the processing engine watches.
+"""
+
+from __future__ import annotations
+
+import importlib
+import uuid
+from datetime import datetime
+from typing import Optional
+
+BACKENDS = {
+    "drive": "utils.drive_queue",
+    "local": "utils.local_queue",
+}
+
+JOBS_FOLDER_NAME = "jobs"
+RAW_FOLDER_NAME  = "raw"
+STATUS_PREFIX    = "status_"
+JOB_PREFIX       = "job_"
+HEARTBEAT_FILE   = "heartbeat.json"
+FILELIST_FILE    = "filelist.json"
+HEARTBEAT_STALE_SECONDS = 90
+
+
+def get_queue(name: str = "drive"):
+    """Return the backend module registered under `name`."""
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown queue backend '{name}' — expected one of {sorted(BACKENDS)}"
+        )
+    return importlib.import_module(BACKENDS[name])
+
+
+def new_job_id() -> str:
+    """Sortable, collision-safe job ID: <timestamp>_<6 hex chars>."""
+    return datetime.now().strftime("%Y%m%d_%H%M%S") + "_" + uuid.uuid4().hex[:6]
+
+
+def job_record(job_id: str, job_payload: dict) -> dict:
+    """The full job_<id>.json contents for a submitted payload."""
+    return {
+        "job_id":    job_id,
+        "submitted": datetime.utcnow().isoformat(),
+        "status":    "queued",
+        **job_payload,
+    }
+
+
+def heartbeat_from(data: Optional[dict]) -> Optional[dict]:
+    """Apply the staleness check to a raw heartbeat.json dict."""
+    if data is None:
+        return None
+    # Check staleness — if last update was > 90 seconds ago, Colab has died
+    updated_str = data.get("updated", "")
+    if updated_str:
+        updated = datetime.fromisoformat(updated_str)
+        age = (datetime.utcnow() - updated).total_seconds()
+        if age > HEARTBEAT_STALE_SECONDS:
+            return {"alive": False, "age_seconds": int(age)}
+    return data
+
+
+def raw_files_from(data: Optional[dict]) -> Optional[list]:
+    """Extract the file list from a raw filelist.json dict."""
+    return data.get("files", []) if data else None